@@ -12,7 +12,7 @@ import time
 
 from inkstone.ft.ft_2d_cnst import ft_2d_cnst
 from inkstone.im import im
-from inkstone.sm import s_1l, s_1l_in, s_1l_out
+from inkstone.sm import SM, s_1l, s_1l_in, s_1l_out
 from inkstone.params import Params
 from inkstone.bx import Bx
 from inkstone.mtr import Mtr
@@ -95,11 +95,14 @@ class Layer:
         self.psil: Optional[np.ndarray] = None
 
         self.im: Optional[Tuple[np.ndarray, np.ndarray]] = None  # interface matrix
-        self.sm: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = None  # scattering matrix
-        self.csm: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = None  # cumulative scattering matrix
-        self.csmr: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = None  # cumulative scattering matrix reversed
+        self.sm: Optional[SM] = None  # scattering matrix. For the incident (output) region, s21 (s12) is an LU factorization tuple.
+        self.csm: Optional[SM] = None  # cumulative scattering matrix
+        self.csmr: Optional[SM] = None  # cumulative scattering matrix reversed
 
         self.al_bl: Optional[Tuple[np.ndarray, np.ndarray]] = None  # the field coefficients (al, bl).
+        self.al_bl_lu: Optional[Tuple[tuple, tuple, tuple]] = None  # LU factors of the two linear systems for al, bl, and the (im, csmp, csmr, csm, csmrn) they are built from
+        self.fs_al_bl: Optional[tuple] = None  # ([phil*al; psil*al], [phil*bl; -psil*bl]) stacked vertically, and the (al_bl, phil) they are built from
+        self.fs_zz: Optional[tuple] = None  # (1j/omega*eizzcm, 1j/omega*mizzcm) for the z field components, and the (eizzcm, mizzcm, omega) they are built from
 
         self.in_mid_out: str = 'mid'  # {'in', 'mid', 'out'}, if this layer is the incident, output, or a middle layer
 
@@ -299,7 +302,7 @@ class Layer:
         # todo: implement add material permittivity and permeability complex tensors
         # todo: for uniform layer, is it simpler?
 
-        t1 = time.process_time()
+        t1 = self.pr.tic()
 
         # calculate the Fourier components of the background material.
         mtr = self.materials[self.material_bg]
@@ -328,7 +331,7 @@ class Layer:
 
     def _cons_ep_mu_cm_3d(self):
         """ Construct epsilon and mu convolution matrices """
-        t1 = time.process_time()
+        t1 = self.pr.tic()
 
         if self.patterns:
             idx = self.pr.idx_conv_mtx
@@ -427,7 +430,7 @@ class Layer:
     def _calc_PQ_3d(self):
         """Calculate the P and Q matrix"""
 
-        t1 = time.process_time()
+        t1 = self.pr.tic()
 
         o = self.pr.omega
         epxx, epxy, epyx, epyy, epzz, \
@@ -465,7 +468,7 @@ class Layer:
     def _calc_eig_3d(self):
         """ Calculate the eigen modes in the layer """
 
-        t1 = time.process_time()
+        t1 = self.pr.tic()
 
         ql2, self.phil = la.eig(- self.P @ self.Q)
         self._rad_cha = np.where(ql2.real > 0)[0].tolist()  # todo: even for radiation channel, if omega.imag larger than omega.real, q02.real is negative
@@ -484,7 +487,7 @@ class Layer:
     def _calc_eig_3d_uniform(self):
         """ Efficient calculation of eigen for uniform layer """
 
-        t1 = time.process_time()
+        t1 = self.pr.tic()
 
         if self.is_vac:
             self.ql = self.pr.q0
@@ -574,7 +577,7 @@ class Layer:
         *   no off-diagonal components in permittivity and permeability
         *   incident waves in x-z plane, no phi rotation.
         """
-        t1 = time.process_time()
+        t1 = self.pr.tic()
 
         o = self.pr.omega
         eixx = self.eixxcm
@@ -652,7 +655,7 @@ class Layer:
     def _calc_im(self):
         """Calculate the interface matrix."""
 
-        t1 = time.process_time()
+        t1 = self.pr.tic()
 
         if self.is_vac:
             self.im = self.pr.im0
@@ -666,7 +669,7 @@ class Layer:
     def _calc_sm(self):
         """ calculate the scattering matrix of current layer """
 
-        t1 = time.process_time()
+        t1 = self.pr.tic()
 
         if self.is_vac and self.thickness == 0:
             self.sm = self.pr.sm0
@@ -694,7 +697,7 @@ class Layer:
         -------
 
         """
-        t1 = time.process_time()
+        t1 = self.pr.tic()
 
         if self.if_mod:
             self._calc_ep_mu_fs_3d()
@@ -4,7 +4,7 @@ from typing import Tuple, Optional, List
 import time
 import numpy as np
 from inkstone.layer import Layer
-from inkstone.sm import s_1l, s_1l_in, s_1l_out
+from inkstone.sm import SM, s_1l, s_1l_in, s_1l_out
 
 
 class LayerCopy:
@@ -23,10 +23,14 @@ class LayerCopy:
         self.name = name
         self.layer = layer
         self._al_bl: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self.al_bl_lu: Optional[Tuple[tuple, tuple, tuple]] = None
+        self.fs_al_bl: Optional[tuple] = None
+        self.fs_zz: Optional[tuple] = None
         self.in_mid_out: str = 'mid'  # {'in', 'mid', 'out'}, if this layer is the incident, output, or a middle layer
 
-        self.sm: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self.sm: Optional[SM] = None
         self._if_t_change = True
+        self._ql_im = None  # the original's (ql, im) that `sm` was calculated from
         self.need_recalc_al_bl = True
 
         self.thickness = thickness
@@ -100,10 +104,13 @@ class LayerCopy:
         return self.layer.rad_cha
 
     def solve(self):
-        t1 = time.process_time()
-        if self.layer.if_mod or self._if_t_change:
+        t1 = self.layer.pr.tic()
+        # the original may have been solved earlier in the same pass, which clears its `if_mod`
+        if self.layer.if_mod or self._if_t_change or self._ql_im is None \
+                or self._ql_im[0] is not self.layer.ql or self._ql_im[1] is not self.layer.im:
             self.layer.solve()
             self._calc_sm()
+            self._ql_im = (self.layer.ql, self.layer.im)
             self._if_t_change = False
         if self.layer.pr.show_calc_time:
             print('{:.6f}'.format(time.process_time() - t1) + '   layer ' + self.name+' solve (layer copy)')
@@ -111,7 +118,7 @@ class LayerCopy:
     def _calc_sm(self):
         """ calculate the scattering matrix of current layer """
 
-        t1 = time.process_time()
+        t1 = self.layer.pr.tic()
 
         if self.is_vac and self.thickness == 0:
             self.sm = self.layer.pr.sm0
@@ -4,14 +4,15 @@ import numpy as np
 import numpy.linalg as la
 # from scipy import sparse as sps
 # import scipy.fft as fft
-from typing import Tuple, List, Union, Optional, Set
-# import time
+from typing import Tuple, List, Union, Optional, Set, Dict
+import time
 from warnings import warn
 from inkstone.recipro import recipro
 from inkstone.g_pts import g_pts
 from inkstone.g_pts_1d import g_pts_1d
 from inkstone.max_idx_diff import max_idx_diff
 from inkstone.conv_mtx_idx import conv_mtx_idx_2d
+from inkstone.sm import SM
 
 
 class Params:
@@ -46,6 +47,7 @@ class Params:
 
         self.gs: Optional[List[Tuple[float, float]]] = None  # list of g points for E and H fields. Added by k_inci to get the ks, i.e. k points for E and H
         self.idx_g: Optional[List[Tuple[int, int]]] = None  # list of g points indices
+        self.idx_g_map: Optional[Dict[Tuple[int, int], int]] = None  # g point index -> position in idx_g
         self.idx_conv_mtx: Optional[np.ndarray] = None  # indexing array to for constructing convolution matrices.
         self.ks: Optional[List[Tuple[float, float]]] = None  # list of k points for E and H fields.
         self.idx_g_ep_mu: Optional[List[Tuple[int, int]]] = None
@@ -64,7 +66,7 @@ class Params:
         self.P0_val: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = None  # Tuple of 4, each is an ndarray of size num_g, containing the diagonal elements of the 4 blocks of P0.
         self.Q0_val: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = None  # Tuple of 4, each is an ndarray of size num_g, containing the diagonal elements of the 4 blocks of Q0.
         self.im0: Optional[Tuple[np.ndarray, np.ndarray]] = None  # vacuum interface matrix
-        self.sm0: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = None  # vacuum scattering matrix, (s11_0, s12_0, s21_0, s22_0), each of s_ij has side length 2*num_g
+        self.sm0: Optional[SM] = None  # vacuum scattering matrix, (s11_0, s12_0, s21_0, s22_0), each of s_ij has side length 2*num_g
         self._rad_cha_0: Optional[List[int]] = None
 
         self.ccnif = "physical"
@@ -113,6 +115,19 @@ class Params:
         if phi is not None:
             self.phi = phi
 
+    @property
+    def show_calc_time(self) -> bool:
+        """
+        If to print the time spent in each step of the calculation.
+        """
+        return self._show_calc_time
+
+    @show_calc_time.setter
+    def show_calc_time(self, val: bool):
+        self._show_calc_time = val
+        # so that the hot paths don't query the process clock when not showing time
+        self.tic = time.process_time if val else _no_tic
+
     @property
     def latt_vec(self) -> Union[float, Tuple[Tuple[float, float], Tuple[float, float]]]:
         """
@@ -380,11 +395,19 @@ class Params:
                 self.idx_g = [(i, 0) for i in idx]
             else:
                 raise Exception("Both reciprocal lattice vectors are infinite. Can't calculate g points.")
+            self.idx_g_map = {o: i for i, o in enumerate(self.idx_g)}
             self._num_g_ac = len(self.gs)
             self._calc_ks()
             self._calc_conv_mtx_idx()
             # self.calc_ai_bo_3d()  # called through _calc_ks() - _calc_angles()
 
+    def idx_g_pos(self, orders: List[Tuple[int, int]]) -> List[int]:
+        """Positions in `idx_g` of the given orders. Raises ValueError for an order that is not in `idx_g`."""
+        try:
+            return [self.idx_g_map[o] for o in orders]
+        except KeyError as e:
+            raise ValueError('order {} not in idx_g'.format(e.args[0])) from None
+
     def _calc_ks(self):
         if self.gs and self.k_inci:
             self.ks = [(g[0]+self.k_inci[0], g[1] + self.k_inci[1]) for g in self.gs]
@@ -530,20 +553,22 @@ class Params:
 
     def _calc_im0(self):
         if self._num_g_ac:
-            a0 = np.diag(2 * np.ones(2 * self._num_g_ac))
+            a0 = 2 * np.eye(2 * self._num_g_ac)
             b0 = np.zeros((2 * self._num_g_ac, 2 * self._num_g_ac))
             self.im0 = (a0, b0)
 
     def _calc_s_0(self):
         """calculate vacuum scattering matrix"""
         # todo: change into sparse to save memory
+        # All s-matrices are complex128 on purpose. In complex64 the eigen-modes of high-contrast layers and the
+        # exp(i q d) factors of evanescent orders keep only a few digits, which the star products then amplify.
         if self._num_g_ac:
             # t1 = time.process_time()
             s11_0 = np.zeros((2 * self._num_g_ac, 2 * self._num_g_ac), dtype=complex)
             s12_0 = np.eye(2 * self._num_g_ac, dtype=complex)
             s21_0 = s12_0
             s22_0 = s11_0
-            self.sm0 = (s11_0, s12_0, s21_0, s22_0)
+            self.sm0 = SM(s11_0, s12_0, s21_0, s22_0)
             # print('_calc_s_0_3d', time.process_time() - t1)
 
     @property
@@ -621,7 +646,7 @@ class Params:
                 if (sa or pa) and od and self.idx_g and \
                         self.sin_phis and self.sin_varthetas and self.cos_phis and self.cos_varthetas:
                     # find the index of the input orders in the g list
-                    idx = [i for order in od for i, j in enumerate(self.idx_g) if j == order]
+                    idx = [self.idx_g_map[order] for order in od if order in self.idx_g_map]
                     for i in range(len(idx)):
                         s = sa[i]
                         p = pa[i]
@@ -631,3 +656,6 @@ class Params:
         self.ai, self.bo = aibo
         # print('calc_ai_bo_3d', time.process_time() - t1)
 
+
+def _no_tic() -> float:
+    return 0.
@@ -2,12 +2,44 @@
 
 import numpy as np
 import numpy.linalg as la
-import scipy.linalg as sla
-import time
+from scipy.linalg.lapack import zgesv, zgetrs
+from inkstone.sm import SM
 # import scipy.sparse as sps
 # import warnings
 
 
+def _idt_minus(x):
+    """
+    I - x, overwriting x, so that no identity matrix is allocated. The matrices are the last two axes of x.
+    """
+    np.negative(x, out=x)
+    r = np.arange(x.shape[-1])
+    x[..., r, r] += 1.
+    return x
+
+
+def _solve_right(t, x):
+    """
+    x @ inv(t), as solve(t^T, x^T)^T.
+
+    Single matrices go to LAPACK zgesv directly, skipping the argument checks of `scipy.linalg.solve`.
+    The transposes of C-ordered arrays are Fortran-ordered, so they are passed without copying. t is overwritten.
+    Stacks of matrices, shape (..., 2N, 2N), go through `numpy.linalg.solve` which batches over the leading axes.
+    """
+    if t.ndim == 2:
+        _, _, p, info = zgesv(t.T, x.T, overwrite_a=1)
+        if info > 0:
+            raise la.LinAlgError('Singular matrix')
+        return p.T
+    return la.solve(t.swapaxes(-1, -2), x.swapaxes(-1, -2)).swapaxes(-1, -2)
+
+
+def _lu_solve(lu_piv, b):
+    """`scipy.linalg.lu_solve` through LAPACK zgetrs directly."""
+    x, _ = zgetrs(*lu_piv, b)
+    return x
+
+
 def rsp(sa11, sa12, sa21, sa22, sb11, sb12, sb21, sb22):
     """
     Take the Redheffer star product (rsp) of two scattering matrices.
@@ -15,14 +47,14 @@ def rsp(sa11, sa12, sa21, sa22, sb11, sb12, sb21, sb22):
     Parameters
     ----------
     sa11, sa12, sa21, sa22, sb11, sb12, sb21, sb22      :   ndarray
-                                                            scattering matrix A and B
+                                                            scattering matrix A and B.
+                                                            Either single (2N, 2N) blocks, or stacks of shape (..., 2N, 2N)
+                                                            in which case the products of all pairs are taken at once.
 
     Returns
     -------
-    s11     :   ndarray
-    s12     :   ndarray
-    s21     :   ndarray
-    s22     :   ndarray
+    SM
+        blocks s11, s12, s21, s22 of the product
 
     References
     ----------
@@ -30,12 +62,6 @@ def rsp(sa11, sa12, sa21, sa22, sb11, sb12, sb21, sb22):
     UTEP EMLab.
     Victor's Notes on Redheffer star product is actually skewed.
     """
-    time1 = time.process_time()
-
-    # identity matrix
-    # idt = np.diag(np.ones(sa11.shape[0]))
-    idt = np.eye(sa11.shape[0], dtype=complex)
-
     # UTEP CEM (correct)
     # (bi, ao) = S (ai, bo), i, o means left 'input' region and right 'output' region, a means right going, b means left going
     # iv12 = la.inv(idt - sb11 @ sa22)
@@ -46,15 +72,18 @@ def rsp(sa11, sa12, sa21, sa22, sb11, sb12, sb21, sb22):
     # s21 = sb21 @ iv21 @ sa21
     # s22 = sb22 + sb21 @ iv21 @ sa22 @ sb12
 
-    t1 = idt - sb11 @ sa22
-    t2 = idt - sa22 @ sb11
-    p1 = sla.solve(t1.T, sa12.T).T
-    p2 = sla.solve(t2.T, sb21.T).T
+    # Intermediate products are combined in place to keep the number of (2N, 2N) temporaries down.
+    t1 = _idt_minus(sb11 @ sa22)
+    t2 = _idt_minus(sa22 @ sb11)
+    p1 = _solve_right(t1, sa12)
+    p2 = _solve_right(t2, sb21)
 
-    s11 = sa11 + p1 @ sb11 @ sa21
+    s11 = p1 @ sb11 @ sa21
+    s11 += sa11
     s12 = p1 @ sb12
     s21 = p2 @ sa21
-    s22 = sb22 + p2 @ sa22 @ sb12
+    s22 = p2 @ sa22 @ sb12
+    s22 += sb22
 
     # Victor's, and several other online notes.
     # This is skewed, i.e. s11 is transmission, s12 is reflection.
@@ -64,9 +93,7 @@ def rsp(sa11, sa12, sa21, sa22, sb11, sb12, sb21, sb22):
     # s11 = sb11 @ la.inv(idt - sa12 @ sb21) @ sa11
     # s12 = sb12 + sb11 @ la.inv(idt - sa12 @ sb21) @ sa12 @ sb22
 
-    # print('RSP', time.process_time() - time1)
-
-    return s11, s12, s21, s22
+    return SM(s11, s12, s21, s22)
 
 
 def rsp_in(sa11, sa12, sa21, sa22, sb11, sb12, sb21, sb22):
@@ -87,25 +114,23 @@ def rsp_in(sa11, sa12, sa21, sa22, sb11, sb12, sb21, sb22):
 
     Returns
     -------
-    s11     :   np.ndarray
-    s12     :   np.ndarray
-    s21     :   np.ndarray
-    s22     :   np.ndarray
+    SM
+        blocks s11, s12, s21, s22 of the product
 
     """
-    idt = np.eye(sa11.shape[0], dtype=complex)
-
-    t1 = idt - sb11 @ sa22
-    t2 = idt - sa22 @ sb11
-    p1 = sla.solve(t1.T, sa12.T).T
-    p2 = sla.solve(t2.T, sb21.T).T
+    t1 = _idt_minus(sb11 @ sa22)
+    t2 = _idt_minus(sa22 @ sb11)
+    p1 = _solve_right(t1, sa12)
+    p2 = _solve_right(t2, sb21)
 
-    s11 = sa11 + p1 @ sla.lu_solve(sa21, sb11.T).T
+    s11 = p1 @ _lu_solve(sa21, sb11.T).T
+    s11 += sa11
     s12 = p1 @ sb12
-    s21 = sla.lu_solve(sa21, p2.T).T
-    s22 = sb22 + p2 @ sa22 @ sb12
+    s21 = _lu_solve(sa21, p2.T).T
+    s22 = p2 @ sa22 @ sb12
+    s22 += sb22
 
-    return s11, s12, s21, s22
+    return SM(s11, s12, s21, s22)
 
 
 def rsp_out(sa11, sa12, sa21, sa22, sb11, sb12, sb21, sb22):
@@ -126,22 +151,61 @@ def rsp_out(sa11, sa12, sa21, sa22, sb11, sb12, sb21, sb22):
 
     Returns
     -------
-    s11     :   np.ndarray
-    s12     :   np.ndarray
-    s21     :   np.ndarray
-    s22     :   np.ndarray
+    SM
+        blocks s11, s12, s21, s22 of the product
 
     """
-    idt = np.eye(sa11.shape[0], dtype=complex)
+    t1 = _idt_minus(sb11 @ sa22)
+    t2 = _idt_minus(sa22 @ sb11)
+    p1 = _solve_right(t1, sa12)
+    p2 = _solve_right(t2, sb21)
+
+    s11 = p1 @ sb11 @ sa21
+    s11 += sa11
+    s12 = _lu_solve(sb12, p1.T).T
+    s21 = p2 @ sa21
+    s22 = p2 @ _lu_solve(sb12, sa22.T).T
+    s22 += sb22
 
-    t1 = idt - sb11 @ sa22
-    t2 = idt - sa22 @ sb11
-    p1 = sla.solve(t1.T, sa12.T).T
-    p2 = sla.solve(t2.T, sb21.T).T
+    return SM(s11, s12, s21, s22)
 
-    s11 = sa11 + p1 @ sb11 @ sa21
-    s12 = sla.lu_solve(sb12, p1.T).T
-    s21 = p2 @ sa21
-    s22 = sb22 + p2 @ sla.lu_solve(sb12, sa22.T).T
 
-    return s11, s12, s21, s22
+def rsp_scan(s11, s12, s21, s22):
+    """
+    All prefix Redheffer star products of a sequence of scattering matrices, i.e. s_0, s_0*s_1, s_0*s_1*s_2, ...
+
+    The sequence is stacked along the first axis. Adjacent pairs are combined in one batched `rsp` call, the prefixes of
+    the pair products are found recursively, and the remaining prefixes are filled in with one more batched call.
+    So there are about 2 log2(m) calls to `rsp` for m matrices, instead of m - 1 sequential ones.
+
+    Parameters
+    ----------
+    s11, s12, s21, s22  :   ndarray
+                            shape (m, 2N, 2N), the blocks of the m scattering matrices in order
+
+    Returns
+    -------
+    SM
+        blocks of shape (m, 2N, 2N), the m prefix products
+    """
+    ss = SM(s11, s12, s21, s22)
+    m = s11.shape[0]
+    if m == 1:
+        return ss
+
+    h = m // 2
+    # products of pairs (0, 1), (2, 3), ..., whose prefixes are the prefixes ending at odd indices
+    pp = rsp_scan(*rsp(*(s[0:2*h:2] for s in ss), *(s[1:2*h:2] for s in ss)))
+
+    out = SM(*(np.empty_like(s) for s in ss))
+    for o, s, p in zip(out, ss, pp):
+        o[0] = s[0]
+        o[1::2] = p
+    # prefixes ending at even indices 2, 4, ...
+    ne = (m - 1) // 2
+    if ne:
+        pe = rsp(*(p[:ne] for p in pp), *(s[2::2] for s in ss))
+        for o, p in zip(out, pe):
+            o[2::2] = p
+
+    return out
@@ -3,18 +3,32 @@
 import numpy as np
 import numpy.linalg as la
 # import scipy.sparse as sps
-import scipy.linalg as sla
+from scipy.linalg.lapack import zgetrf, zgetrs
 from warnings import warn
 from collections import OrderedDict
+from bisect import bisect_left, bisect_right
 from typing import Tuple, Optional, List, Dict, Union
 import time
 
-from inkstone.rsp import rsp, rsp_in, rsp_out
+from inkstone.rsp import rsp, rsp_in, rsp_out, rsp_scan
+from inkstone.sm import SM
 from inkstone.params import Params
 from inkstone.mtr import Mtr
 from inkstone.layer import Layer
 from inkstone.layer_copy import LayerCopy
 
+# Limits for combining a chain of s-matrices with the batched prefix scan `rsp_scan` instead of one `rsp` per block.
+# Timing all prefixes of m random (2N, 2N) blocks (numpy 2.4, OpenBLAS, 1 core), scan time / serial time:
+#     2N \ m    4      12     20     30     60
+#     4       1.86   0.83   0.81   0.82   0.45
+#     8       1.65   1.06   0.91   0.75   0.67
+#     10        -    1.20   1.06   1.00   1.01
+#     12      1.68     -      -    1.29     -
+#     20      1.58     -      -    1.95     -
+# The scan only pays off for side lengths up to 8 (num_g <= 4) and chains of about 20 blocks or more.
+SCAN_MAX_SIZE = 8  # largest side length 2*num_g of the s-matrix blocks for the scan
+SCAN_MIN_BLOCKS = 20  # fewest non-identity blocks in a chain for the scan
+
 
 class Inkstone:
     # todo: more tests of magneto-optics and gyro-magnetic
@@ -57,19 +71,27 @@ class Inkstone:
         self.ao: Optional[np.ndarray] = None  # transmitted wave amplitudes in the output region
         self.bi: Optional[np.ndarray] = None  # reflected wave amplitudes in the incident region
         self._need_recalc_bi_ao: bool = True
+        self._layers_topology_dirty: bool = True  # if layers were added since the incident/middle/output roles were assigned
 
         # thickness of all layers, and cumulative thickness
         self.thicknesses: OrderedDict[str, float] = OrderedDict()
+        self._thickness_arr: np.ndarray = np.zeros(0)  # thicknesses of all layers in order, same as `self.thicknesses.values()`
         self.total_thickness: float = 0.
         self.thicknesses_c: List[float] = []
+        self._thicknesses_c_arr: np.ndarray = np.zeros(0)  # same as `self.thicknesses_c`, for binning z
 
         self.materials: Dict[str, Mtr] = {'vacuum': Mtr(1, 1, name='vacuum')}  # materials used
 
         self.layers: OrderedDict[str, Layer] = OrderedDict()  # all layers
+        self._layers_list: List[Union[Layer, LayerCopy]] = []  # all layers in order, same as `list(self.layers.values())`
+        self._layer_names: List[str] = []  # names of all layers in order, same as `list(self.layers.keys())`
+        self._layer_idx: Dict[str, int] = {}  # position of each layer in `_layer_names`
 
-        self.sm: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = None
-        self.csms: List[List[Optional[Tuple[int, int, Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]]]] = []  # the cumulative scattering matrices.
-        self.csmsr: List[Optional[Tuple[int, int, Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]]] = []  # the cumulative scattering matrices reversed.
+        self.sm: Optional[SM] = None
+        self._sm_full: Optional[np.ndarray] = None  # `self.sm` assembled into one (4N, 4N) matrix, built once per `_calc_sm` for `_calc_bi_ao` and `GetSMatrixDet`
+        self.csms: List[List[Optional[Tuple[int, int, SM]]]] = []  # the cumulative scattering matrices.
+        self.csmsr: List[Optional[Tuple[int, int, SM]]] = []  # the cumulative scattering matrices reversed.
+        self._csmsr_keys: List[int] = []  # minus the first layer index of each entry in `csmsr`, in ascending order for bisecting
 
     @property
     def lattice(self) -> Union[float, Tuple[Tuple[float, float], Tuple[float, float]]]:
@@ -242,12 +264,16 @@ class Inkstone:
         material_background :   background material
         """
 
-        if name not in self.layers.keys():
+        if name not in self.layers:
             layer = Layer(name, thickness, material_background, self.materials, self.pr)
             self.layers[name] = layer
+            self._layer_idx[name] = len(self._layers_list)
+            self._layers_topology_dirty = True
+            self._layers_list.append(layer)
+            self._layer_names.append(name)
             self.thicknesses[name] = thickness
-            self.total_thickness += thickness
-            self.thicknesses_c.append(self.total_thickness)
+            self._thickness_arr = np.append(self._thickness_arr, thickness)
+            self._calc_thicknesses()
             self.csms.append([])
         else:
             warn('A layer with the given name already exists. This new layer is NOT added.')
@@ -268,14 +294,18 @@ class Inkstone:
         thickness       :   thickness of the layer copy. Can be different than original.
 
         """
-        if name not in self.layers.keys():
+        if name not in self.layers:
             layer = self.layers[original_layer]
             layer_copy = LayerCopy(name, layer, thickness)
             self.layers[name] = layer_copy
+            self._layer_idx[name] = len(self._layers_list)
+            self._layers_topology_dirty = True
+            self._layers_list.append(layer_copy)
+            self._layer_names.append(name)
 
             self.thicknesses[name] = thickness
-            self.total_thickness += thickness
-            self.thicknesses_c.append(self.total_thickness)
+            self._thickness_arr = np.append(self._thickness_arr, thickness)
+            self._calc_thicknesses()
 
             self.csms.append([])
         else:
@@ -295,11 +325,12 @@ class Inkstone:
         material_bg :   choose a different background material.
 
         """
-        if name in self.layers.keys():
+        if name in self.layers:
             layer = self.layers[name]  #: Layer2D
             if thickness is not None and thickness != layer.thickness:
                 layer.set_layer(thickness=thickness)
                 self.thicknesses[name] = thickness
+                self._thickness_arr[self._layer_idx[name]] = thickness
                 self._calc_thicknesses()
             if material_bg is not None and material_bg != layer.material_bg:
                 layer.set_layer(material_bg=material_bg)
@@ -333,7 +364,7 @@ class Inkstone:
         mu
 
         """
-        if name in self.layers.keys():
+        if name in self.layers:
             result = self.layers[name].reconstruct(nx, ny)
             return result
         else:
@@ -343,11 +374,9 @@ class Inkstone:
         """
         calculate total thickness and cumulative thickness
         """
-        self.total_thickness = 0.
-        self.thicknesses_c = []
-        for layer_name, thickness in self.thicknesses.items():
-            self.total_thickness += thickness
-            self.thicknesses_c.append(self.total_thickness)
+        self._thicknesses_c_arr = np.cumsum(self._thickness_arr)
+        self.thicknesses_c = self._thicknesses_c_arr.tolist()
+        self.total_thickness = self.thicknesses_c[-1] if self.thicknesses_c else 0.
 
     def AddPattern(self,
                    layer: str,
@@ -530,7 +559,7 @@ class Inkstone:
         if (s_amplitude is not None) or (p_amplitude is not None) or (order is not None) or (s_amplitude_back is not None) or (p_amplitude_back is not None) or (order_back is not None):
             self.pr.set_inci_ord_amp(s_amplitude, p_amplitude, order, s_amplitude_back, p_amplitude_back, order_back)
             self._need_recalc_bi_ao = True
-            for ly in self.layers.values():
+            for ly in self._layers_list:
                 ly.need_recalc_al_bl = True
 
     def SetFrequency(self, freq: Union[float, complex]):
@@ -548,12 +577,12 @@ class Inkstone:
         """Calculate the field coefficients al and bl of a layer"""
 
         n_layers = len(self.layers)
-        layersl = list(self.layers.values())
+        layersl = self._layers_list
         layer = layersl[i]
 
         if layer.need_recalc_al_bl:
 
-            t1 = time.process_time()
+            t1 = self.pr.tic()
 
             if layer.in_mid_out == 'in':
                 layer.al_bl = (self.pr.ai, self.bi)
@@ -571,47 +600,59 @@ class Inkstone:
                 csm = layersl[i].csm
                 csmp = layersl[i-1].csm
 
-                # reshape 1d array ai and bo into a 2d 1-column vector
-                ai_v = self.pr.ai.reshape((2 * self.pr.num_g, 1))
-                bo_v = self.pr.bo.reshape((2 * self.pr.num_g, 1))
+                ai = self.pr.ai
+                bo = self.pr.bo
 
                 al0 = layer.im[0]
                 bl0 = layer.im[1]
-                I = np.diag(np.ones(2 * self.pr.num_g, dtype=complex))  # identity
-                # csm
-                sc11, sc12, sc21, sc22 = csm
-                # csm of previous layer
-                scp11, scp12, scp21, scp22 = csmp
-                # csmr
-                sci11, sci12, sci21, sci22 = csmr
-                # csmr of next layer
-                scin11, scin12, scin21, scin22 = csmrn
+                # in the comments below, sc, scp, sci, scin are csm, csm of previous layer, csmr, csmr of next layer
 
+                # For a non-vacuum incident (output) layer, s21 (s12) of its s-matrix is stored as an LU factorization,
+                # computed once when the layer is solved (see `~.sm.s_1l_in` and `~.sm.s_1l_out`).
+                # The factorization is reused here for every excitation.
                 if (layersl[i-1].in_mid_out == "in") and not layersl[i-1].is_vac:
-                    sa = sla.lu_solve(scp21, ai_v)
-                    sb = sci12 @ bo_v
-                    al = 1. / 2. * (bl0 @ sla.solve((I - sci11 @ scp22), (sci11 @ sa + sb))
-                                    + al0 @ sla.solve((I - scp22 @ sci11), (sa + scp22 @ sb)))
+                    sa_al = zgetrs(*csmp.s21, ai)[0]
                 else:
-                    sa = scp21 @ ai_v
-                    sb = sci12 @ bo_v
-                    al = 1. / 2. * (bl0 @ sla.solve((I - sci11 @ scp22), (sci11 @ sa + sb))
-                                    + al0 @ sla.solve((I - scp22 @ sci11), (sa + scp22 @ sb)))
+                    sa_al = csmp.s21 @ ai
+                sb_al = csmr.s12 @ bo
 
+                sa_bl = csm.s21 @ ai
                 if (layersl[i+1].in_mid_out == "out") and not layersl[i+1].is_vac:
-                    sa = sc21 @ ai_v
-                    sb = sla.lu_solve(scin12, bo_v)
-                    bl = 1. / 2. * (bl0 @ sla.solve((I - sc22 @ scin11), (sa + sc22 @ sb))
-                                    + al0 @ sla.solve((I - scin11 @ sc22), (scin11 @ sa + sb)))
+                    sb_bl = zgetrs(*csmrn.s12, bo)[0]
                 else:
-                    sa = sc21 @ ai_v
-                    sb = scin12 @ bo_v
-                    bl = 1. / 2. * (bl0 @ sla.solve((I - sc22 @ scin11), (sa + sc22 @ sb))
-                                    + al0 @ sla.solve((I - scin11 @ sc22), (scin11 @ sa + sb)))
-
-                # ravel 2d array (just one column) to 1d array
-                al = al.ravel()
-                bl = bl.ravel()
+                    sb_bl = csmrn.s12 @ bo
+
+                # Since (I - A B)^-1 A = A (I - B A)^-1, al and bl each need only one linear solve:
+                # (I - sci11 scp22)^-1 (sci11 sa + sb) = sci11 u + sb, with u = (I - scp22 sci11)^-1 (sa + scp22 sb),
+                # (I - scin11 sc22)^-1 (scin11 sa + sb) = scin11 v + sb, with v = (I - sc22 scin11)^-1 (sa + sc22 sb).
+                # The left-hand sides only depend on the structure, not on the excitation. Their LU factors are kept
+                # on the layer, so that a new excitation of the same structure costs only back substitutions.
+                # The csm's are replaced by new objects whenever they are recalculated, so identity tells if they changed.
+                key = (layer.im, csmp, csmr, csm, csmrn)
+                if layer.al_bl_lu is None or any(a is not b for a, b in zip(layer.al_bl_lu[0], key)):
+                    # The left-hand sides are formed in place, without allocating an identity matrix.
+                    lhs = np.empty((2, 2 * self.pr.num_g, 2 * self.pr.num_g), dtype=complex)
+                    np.matmul(csmp.s22, csmr.s11, out=lhs[0])
+                    np.matmul(csm.s22, csmrn.s11, out=lhs[1])
+                    np.negative(lhs, out=lhs)
+                    r = range(2 * self.pr.num_g)
+                    lhs[:, r, r] += 1.
+                    # LAPACK getrf/getrs directly, without the argument checks of scipy's lu_factor and lu_solve
+                    # LAPACK wants Fortran order. Factor the transposes, which are Fortran-ordered views of the
+                    # C-ordered lhs, in place, and solve with trans=1. This avoids copying lhs into Fortran order.
+                    lus = [zgetrf(lhs[0].T, overwrite_a=1), zgetrf(lhs[1].T, overwrite_a=1)]
+                    if lus[0][2] > 0 or lus[1][2] > 0:
+                        raise la.LinAlgError('Singular matrix')
+                    layer.al_bl_lu = (key, lus[0][:2], lus[1][:2])
+                u = zgetrs(*layer.al_bl_lu[1], sa_al + csmp.s22 @ sb_al, trans=1)[0]
+                v = zgetrs(*layer.al_bl_lu[2], sa_bl + csm.s22 @ sb_bl, trans=1)[0]
+
+                # al = 1/2 (bl0 (sci11 u + sb_al) + al0 u),  bl = 1/2 (bl0 v + al0 (scin11 v + sb_bl)).
+                # Put the vectors multiplying al0 and bl0 side by side, so that each is one product with two columns.
+                x = al0 @ np.column_stack([u, csmrn.s11 @ v + sb_bl])
+                x += bl0 @ np.column_stack([csmr.s11 @ u + sb_al, v])
+                x *= 1. / 2.
+                al, bl = x.T.copy()
                 layer.al_bl = (al, bl)
 
             layer.need_recalc_al_bl = False
@@ -626,27 +667,50 @@ class Inkstone:
         # this takes a little bit of time (~1ms)
 
         if self._need_recalc_bi_ao:
-            t1 = time.process_time()
-            ai_v = self.pr.ai.reshape((2 * self.pr.num_g, 1))
-            bo_v = self.pr.bo.reshape((2 * self.pr.num_g, 1))
-            sm11 = self.sm[0]
-            sm12 = self.sm[1]
-            sm21 = self.sm[2]
-            sm22 = self.sm[3]
-
-            bi = sm11 @ ai_v + sm12 @ bo_v
-            ao = sm21 @ ai_v + sm22 @ bo_v
-
-            # ravel 2d array (just one column) to 1d array
-            bi = bi.ravel()
-            ao = ao.ravel()
-            self.bi = bi
-            self.ao = ao
+            t1 = self.pr.tic()
+            # [bi; ao] = [[s11, s12], [s21, s22]] @ [ai; bo] in one matrix-vector product
+            y = self._sm_full @ np.concatenate([self.pr.ai, self.pr.bo])
+            self.bi = y[:2 * self.pr.num_g]
+            self.ao = y[2 * self.pr.num_g:]
             self._need_recalc_bi_ao = False
 
             if self.pr.show_calc_time:
                 print('{:.6f}   bi ao'.format(time.process_time() - t1))
 
+    def _rsp(self, sa: SM, sb: SM) -> SM:
+        """
+        Redheffer star product of two scattering matrices.
+        Zero-thickness layers have the identity scattering matrix `sm0`, in which case the product is the other one.
+        """
+        if sb is self.pr.sm0:
+            return sa
+        if sa is self.pr.sm0:
+            return sb
+        return rsp(*sa, *sb)
+
+    def _rsp_chain(self, sms: List[SM]) -> List[SM]:
+        """
+        All prefix products sms[0], sms[0]*sms[1], sms[0]*sms[1]*sms[2], ... of a chain of scattering matrices.
+        """
+        # blocks that are a single zero-thickness layer (sm0, the identity) don't change the product
+        ks = [k for k, s in enumerate(sms) if k == 0 or s is not self.pr.sm0]
+        if len(ks) >= SCAN_MIN_BLOCKS and 2 * self.pr.num_g <= SCAN_MAX_SIZE:
+            # For small matrices and long chains the cost is the python overhead per rsp call, so combine the chain in
+            # a log-depth scan of batched calls. Otherwise the scan's ~2x arithmetic outweighs that, chain sequentially.
+            pf = rsp_scan(*(np.stack([sms[k][c] for k in ks]) for c in range(4)))
+            ps = [SM(*(p[m] for p in pf)) for m in range(len(ks))]
+        else:
+            ps = [sms[0]]
+            for k in ks[1:]:
+                ps.append(self._rsp(ps[-1], sms[k]))
+        out = []
+        m = 0
+        for k in range(len(sms)):
+            if m + 1 < len(ks) and ks[m + 1] == k:
+                m += 1
+            out.append(ps[m])
+        return out
+
     def _calc_sm(self):
         """
         Calculate the scattering matrix of the entire structure.
@@ -654,53 +718,52 @@ class Inkstone:
         # Dynamic csms.
 
         if self._need_recalc_sm:
-            t1 = time.process_time()
+            t1 = self.pr.tic()
 
             n_layers = len(self.layers)
-            layersl = list(self.layers.values())
-
-            # todo: thickness=0 layer no need to include, rsp slow
+            layersl = self._layers_list
 
             # exclude the first (incident) layer
             layersl[0].solve()
-            ll = layersl[1:]
-            nl = n_layers - 1
-            _csms = [[(i - 1, j - 1, csm) for (i, j, csm) in li] for li in self.csms[1:]]
-            _lm = [a - 1 for a in self._layers_mod if a > 0]
+            # the cached blocks are kept in place, indexed by their first layer
+            lm = [0] + [a for a in self._layers_mod if a > 0]
 
             # calculate csm of uml blocks
-            lm = [-1] + _lm
             for i, ilm in enumerate(lm[1:]):
                 mp = lm[i] + 1
                 if mp < ilm:
-                    csm = _csms[mp][-1][2]
-                    j = _csms[mp][-1][1] + 1
+                    csm = self.csms[mp][-1][2]
+                    j = self.csms[mp][-1][1] + 1
                     while j < ilm:
-                        csm = rsp(*csm, *(_csms[j][-1][2]))
-                        _csms[mp].append((mp, j, csm))
-                        j = _csms[j][-1][1] + 1
-                ll[ilm].solve()
-                _csms[ilm].append((ilm, ilm, ll[ilm].sm))
+                        csm = self._rsp(csm, self.csms[j][-1][2])
+                        self.csms[mp].append((mp, j, csm))
+                        j = self.csms[j][-1][1] + 1
+                layersl[ilm].solve()
+                self.csms[ilm].append((ilm, ilm, layersl[ilm].sm))
 
             # handle the first layer
             if layersl[0].is_vac:
-                self.csms[1:] = [[(i+1, j+1, csm) for (i, j, csm) in li] for li in _csms]
-                self.csms[0].append((0, 0, self.pr.sm0))
-                self.csms[0] += [(i-1, j, csm) for (i, j, csm) in self.csms[1]]
+                if not self.csms[0]:
+                    self.csms[0].append((0, 0, self.pr.sm0))
+                # entries of unmodified leading layers are already in csms[0]
+                self.csms[0] += [(0, j, csm) for (i, j, csm) in self.csms[1] if j > self.csms[0][-1][1]]
                 layersl[0].csm = layersl[0].sm
-                layersl[1].csm = self.csms[0][1][2]
+                layersl[1].csm = self.csms[1][0][2]
             else:
-                self.csms[1:] = [[(i + 1, j + 1, csm) for (i, j, csm) in li] for li in _csms]
-                self.csms[0].append((0, 0, layersl[0].sm))
-                ss = rsp_in(*(layersl[0].sm), *(_csms[0][-1][2]))
-                self.csms[0].append((0, _csms[0][-1][1]+1, ss))
+                if not self.csms[0]:
+                    self.csms[0].append((0, 0, layersl[0].sm))
+                e1 = self.csms[1][-1][1]
+                if self.csms[0][-1][1] < e1:
+                    ss = rsp_in(*(layersl[0].sm), *(self.csms[1][-1][2]))
+                    self.csms[0].append((0, e1, ss))
+                    layersl[e1].csm = ss
                 layersl[0].csm = layersl[0].sm
-                layersl[_csms[0][-1][1]+1].csm = ss
 
             # handle last layer(s)
             if layersl[-1].is_vac:
                 [li.append((li[-1][0], n_layers - 1, li[-1][2])) for li in self.csms if li[-1][1] == n_layers - 2]
-            elif self._layers_mod[-1] == n_layers-1:
+            elif self._layers_mod[-1] >= n_layers-2:
+                # s12 of the output region is in LU form, it can only be combined through rsp_out
                 s = next(ll[-1] for ll in self.csms if ll[-1][1] == n_layers-2)
                 csm = rsp_out(*(s[2]), *(layersl[-1].sm))
                 self.csms[s[0]].append((s[0], n_layers-1, csm))
@@ -708,21 +771,34 @@ class Inkstone:
                 self._calc_csmr_layer(self._layers_mod[-1]+1)
 
             # from new blocks calc overall sm
-            csm = self.csms[0][-1][2]
-            j = self.csms[0][-1][1] + 1
-            layersl[self.csms[0][-1][1]].csm = csm
-            while j < n_layers:
-                csm = rsp(*csm, *self.csms[j][-1][2])
-                list(self.layers.values())[j].csm = csm
-                self.csms[0].append((0, self.csms[j][-1][1], csm))
-                j = self.csms[j][-1][1] + 1
+            # The blocks between modified layers are already collapsed above and cached in csms. The chain stays in
+            # scattering-matrix form: as transfer matrices the star product would be a plain matrix product, but those
+            # carry exp(+|Im q| d) of the evanescent orders and lose all precision for thick layers. And since every
+            # factor is (2N, 2N), reassociating the chain (multi_dot) would not reduce the flops anyway.
+            layersl[self.csms[0][-1][1]].csm = self.csms[0][-1][2]
+            blocks = [self.csms[0][-1]]
+            while blocks[-1][1] < n_layers - 1:
+                blocks.append(self.csms[blocks[-1][1] + 1][-1])
+            for b, csm in zip(blocks[1:], self._rsp_chain([b[2] for b in blocks])[1:]):
+                layersl[b[1]].csm = csm
+                self.csms[0].append((0, b[1], csm))
 
             self.sm = self.csms[0][-1][2]
+            self._sm_full = np.block([[self.sm.s11, self.sm.s12], [self.sm.s21, self.sm.s22]])
             self._need_recalc_sm = False
 
             if self.pr.show_calc_time:
                 print('{:.6f}   calc sm'.format(time.process_time() - t1))
 
+    def _block_till(self, j: int, k: int) -> int:
+        """
+        Index in `self.csms[j]` of the longest cached block that starts at layer j and ends at or before layer k.
+
+        The entries of `self.csms[j]` are (j, end, sm) in increasing `end`, so they are bisected with (j, k + 1).
+        The comparison is decided by the first two elements and never reaches the s-matrix.
+        """
+        return bisect_left(self.csms[j], (j, k + 1)) - 1
+
     def _calc_csm_layer(self, i: int):
         """
         Calculate cumulative scattering matrix from the incident to given layer.
@@ -733,32 +809,37 @@ class Inkstone:
         ----------
         i   :   index of the layer to calculate csm
         """
-        t1 = time.process_time()
+        t1 = self.pr.tic()
 
-        layersl = list(self.layers.values())
+        layersl = self._layers_list
         if i == len(layersl) - 1:
             warn('csm of the last layer is by definition the overall csm and should have been calculated already.', UserWarning)
-        else:
-            ii, s = next((j, x) for j, x in enumerate(reversed(self.csms[0])) if x[1] <= i)
-            ii = len(self.csms[0]) - ii - 1
+        # `_determine_recalc` resets csm of all layers affected by a modification, so a csm still there is valid.
+        elif layersl[i].csm is None:
+            ii = self._block_till(0, i)
+            s = self.csms[0][ii]
             ix = s[1]
             if ix < i:
                 ix += 1
                 csm = s[2]
                 if s[1] == 0:
-                    s1 = next(s for s in reversed(self.csms[ix]) if s[1] <= i)
+                    s1 = self.csms[ix][self._block_till(ix, i)]
                     csm = rsp_in(*csm, *s1[2])
                     layersl[s1[1]].csm = csm
                     ii += 1
                     self.csms[0].insert(ii, (0, s1[1], csm))
                     ix = s1[1] + 1
+                sms = [csm]
+                ends = []
                 while ix <= i:
-                    s1 = next(s for s in reversed(self.csms[ix]) if s[1] <= i)
-                    csm = rsp(*csm, *s1[2])
-                    layersl[s1[1]].csm = csm
-                    ii += 1
-                    self.csms[0].insert(ii, (0, s1[1], csm))
+                    s1 = self.csms[ix][self._block_till(ix, i)]
+                    sms.append(s1[2])
+                    ends.append(s1[1])
                     ix = s1[1] + 1
+                for e, csm in zip(ends, self._rsp_chain(sms)[1:]):
+                    layersl[e].csm = csm
+                    ii += 1
+                    self.csms[0].insert(ii, (0, e, csm))
 
         if self.pr.show_calc_time:
             print('{:.6f}   _calc_csm_layer'.format(time.process_time() - t1))
@@ -773,66 +854,80 @@ class Inkstone:
         ----------
         i   :   index of the layer (forward counting) to calculate csmr till (included).
         """
-        t1 = time.process_time()
+        t1 = self.pr.tic()
 
         n_layers = len(self.layers)
-        layersl = list(self.layers.values())
+        layersl = self._layers_list
 
-        if i < n_layers:
+        # `_determine_recalc` resets csmr of all layers affected by a modification, so a csmr still there is valid.
+        if i < n_layers and layersl[i].csmr is None:
             if not self.csmsr:
                 self.csmsr.append(self.csms[-1][0])
+                self._csmsr_keys.append(-(n_layers - 1))
                 layersl[-1].csmr = self.csms[-1][0][2]
                 if layersl[-1].is_vac:
                     _csm = (n_layers-2, n_layers-1, self.csms[-2][0][2])
                     self.csmsr.append(_csm)
+                    self._csmsr_keys.append(-(n_layers - 2))
                     layersl[-2].csmr = self.csms[-2][0][2]
                     if self.csms[-2][-1][1] == n_layers - 2:
                         self.csms[-2].append(_csm)
 
-            ii, s = next((j, x) for j, x in enumerate(reversed(self.csmsr)) if x[0] >= i)
-            ii = len(self.csmsr) - ii - 1
+            # the entry starting closest to i from the output side
+            ii = bisect_right(self._csmsr_keys, -i) - 1
+            s = self.csmsr[ii]
             ix = s[0]
 
             if ix > i:
                 j = i
                 _csms = []
                 while j < ix:
-                    s1 = next(x for x in reversed(self.csms[j]) if x[1] < ix)
+                    s1 = self.csms[j][self._block_till(j, ix - 1)]
                     _csms.append(s1)
                     j = s1[1] + 1
 
                 csm = s[2]
-                if ix == n_layers - 1:
+                if ix == n_layers - 1 and not layersl[-1].is_vac:
                     ss = _csms.pop(-1)
                     csm = rsp_out(*ss[2], *csm)
                     layersl[ss[0]].csmr = csm
-                    self.csms[ss[0]].append((ss[0], n_layers - 1, csm))
+                    if self.csms[ss[0]][-1][1] < n_layers - 1:
+                        self.csms[ss[0]].append((ss[0], n_layers - 1, csm))
                     ii += 1
                     self.csmsr.insert(ii, (ss[0], n_layers - 1, csm))
+                    self._csmsr_keys.insert(ii, -ss[0])
 
                 for s in reversed(_csms):
-                    csm = rsp(*s[2], *csm)
+                    csm = self._rsp(s[2], csm)
                     layersl[s[0]].csmr = csm
-                    self.csms[s[0]].append((s[0], n_layers - 1, csm))
+                    if self.csms[s[0]][-1][1] < n_layers - 1:
+                        self.csms[s[0]].append((s[0], n_layers - 1, csm))
                     ii += 1
                     self.csmsr.insert(ii, (s[0], n_layers - 1, csm))
+                    self._csmsr_keys.insert(ii, -s[0])
 
         if self.pr.show_calc_time:
             print('{:.6f}   _calc_csmr_layer'.format(time.process_time() - t1))
 
     def _determine_layers(self):
         """Determine if a layer is the incident or the output layer."""
-        for idx, layer in enumerate(self.layers.values()):
-            if idx == 0:
-                if layer.thickness != 0:
-                    warn('You set the first layer (incident region) thickness to be nonzero. This thickness is ignored (i.e. treated as zero).')
-                layer.in_mid_out = 'in'
-            elif idx == len(self.layers.values()) - 1:
-                if layer.thickness != 0:
-                    warn('You set the last layer (output region) thickness to be nonzero. This thickness is ignored (i.e. treated as zero).')
-                layer.in_mid_out = 'out'
-            else:
-                layer.in_mid_out = 'mid'
+        layersl = self._layers_list
+        # the roles only change when layers are added
+        if self._layers_topology_dirty:
+            n_layers = len(layersl)
+            for idx, layer in enumerate(layersl):
+                if idx == 0:
+                    layer.in_mid_out = 'in'
+                elif idx == n_layers - 1:
+                    layer.in_mid_out = 'out'
+                else:
+                    layer.in_mid_out = 'mid'
+            self._layers_topology_dirty = False
+
+        if layersl and layersl[0].thickness != 0:
+            warn('You set the first layer (incident region) thickness to be nonzero. This thickness is ignored (i.e. treated as zero).')
+        if len(layersl) > 1 and layersl[-1].thickness != 0:
+            warn('You set the last layer (output region) thickness to be nonzero. This thickness is ignored (i.e. treated as zero).')
 
         # todo: when _in_mid_out changes, the layer's sm, al, bl, idx_sm_c_mod, idx_sm_ci_mod all may change.
 
@@ -840,12 +935,11 @@ class Inkstone:
         """decide the recalculation token of the subroutines in solver"""
         # t1 = time.process_time()
 
-        n_layers = len(self.layers)
-        layersl = list(self.layers.values())
+        layersl = self._layers_list
 
         # collect the indices of the layers that needs recalculation
         self._layers_mod = []
-        for i, layer in enumerate(self.layers.values()):
+        for i, layer in enumerate(layersl):
             if layer.if_mod or layer.if_t_change:
                 self._need_recalc_sm = True
                 self._layers_mod.append(i)
@@ -853,25 +947,25 @@ class Inkstone:
         if self._layers_mod:
             for layer in layersl[self._layers_mod[0]:]:
                 layer.csm = None
-            for layer in layersl[:self._layers_mod[-1]]:
+            for layer in layersl[:self._layers_mod[-1] + 1]:
                 layer.csmr = None
 
-        # clear all csm that contains a ml
-        if self._need_recalc_sm:
-            lm = [-1] + self._layers_mod
-            for i, ilm in enumerate(self._layers_mod):
-                for j in range(lm[i]+1, ilm+1):
-                    if self.csms[j]:
-                        iii = next((ii for ii, s in enumerate(self.csms[j]) if s[1] >= ilm), n_layers)
-                        del self.csms[j][iii:]
-            if self.csmsr:
-                iii = next((ii for ii, s in enumerate(self.csmsr) if s[0] <= self._layers_mod[-1]), n_layers)
-                del self.csmsr[iii:]
+            # clear all csm that contains a ml
+            j0 = 0
+            for ilm in self._layers_mod:
+                # blocks starting after the previous modified layer are invalid from the first one reaching ilm
+                for j in range(j0, ilm + 1):
+                    del self.csms[j][self._block_till(j, ilm - 1) + 1:]
+                j0 = ilm + 1
+            # reversed blocks are invalid from the first one starting at or before the last modified layer
+            iii = bisect_left(self._csmsr_keys, -self._layers_mod[-1])
+            del self.csmsr[iii:]
+            del self._csmsr_keys[iii:]
 
         # update the recalc tokens of ai bo, al bl
         if self._need_recalc_sm:
             self._need_recalc_bi_ao = True
-            for layer in self.layers.values():
+            for layer in layersl:
                 layer.need_recalc_al_bl = True
 
         # print('determine recalc', time.process_time() - t1)
@@ -882,7 +976,7 @@ class Inkstone:
 
         All user API that require solving will call this method to solve the structure first.
         """
-        t1 = time.process_time()
+        t1 = self.pr.tic()
 
         if not self.pr.q0_contain_0:
             self._determine_layers()
@@ -913,12 +1007,7 @@ class Inkstone:
             shape (num_g, N) where N is the length of zs. forward and backward field coefficients.
 
         """
-        if z is None:
-            za = np.array([0.])
-        elif hasattr(z, "__len__"):
-            za = np.array(z)
-        else:
-            za = np.array([z])
+        za = np.atleast_1d(0. if z is None else z)  # an ndarray z is used without copying
 
         t = self.layers[layer].thickness
         if self.layers[layer].in_mid_out == 'in':
@@ -930,24 +1019,46 @@ class Inkstone:
         elif (za < 0).any() or (za > t).any():
             warn('Requesting fields of the output layer at a position outside the layer. Fields may be diverging.', UserWarning)
 
-        al, bl = self.layers[layer].al_bl  # for in/out layer?
-        phil = self.layers[layer].phil
-        psil = self.layers[layer].psil
-        qla = self.layers[layer].ql[:, None]  # 1-column 2d array of length 2num_g
-        d = self.layers[layer].thickness
-
-        ef = phil * al @ np.exp(1j * qla * za)
-        eb = phil * bl @ np.exp(1j * qla * (d - za))
-        hf = psil * al @ np.exp(1j * qla * za)
-        hb = -psil * bl @ np.exp(1j * qla * (d - za))
-        exf, exb, hxf, hxb = [a[:self.pr.num_g, :] for a in [ef, eb, hf, hb]]
-        eyf, eyb, hyf, hyb = [a[self.pr.num_g:, :] for a in [ef, eb, hf, hb]]
-        Kx = self.pr.Kx
-        Ky = self.pr.Ky
-        ezf = 1j / self.omega * self.layers[layer].eizzcm @ (Kx[:, None] * hyf - Ky[:, None] * hxf)
-        ezb = 1j / self.omega * self.layers[layer].eizzcm @ (Kx[:, None] * hyb - Ky[:, None] * hxb)
-        hzf = 1j / self.omega * self.layers[layer].mizzcm @ (Kx[:, None] * eyf - Ky[:, None] * exf)
-        hzb = 1j / self.omega * self.layers[layer].mizzcm @ (Kx[:, None] * eyb - Ky[:, None] * exb)
+        ly = self.layers[layer]
+        al, bl = ly.al_bl  # for in/out layer?
+        phil = ly.phil
+        psil = ly.psil
+        qla = ly.ql[:, None]  # 1-column 2d array of length 2num_g
+        d = ly.thickness
+
+        # The eigen-modes scaled by the field coefficients only change with al_bl (replaced whenever recalculated) and
+        # phil (replaced when the layer is solved), so they are kept on the layer for repeated field queries.
+        # e and h of the same direction share the exponential, so they are stacked and each direction is one product.
+        if ly.fs_al_bl is None or ly.fs_al_bl[0] is not ly.al_bl or ly.fs_al_bl[1] is not phil:
+            ly.fs_al_bl = (ly.al_bl, phil, (np.vstack([phil * al, psil * al]), np.vstack([phil * bl, -psil * bl])))
+        ehl_al, ehl_bl = ly.fs_al_bl[2]
+
+        if za.size == 1:
+            # A single z plane (the default) is a matrix-vector product per direction, and the backward exponential
+            # costs no more directly than through exp_f.
+            ehf = (ehl_al @ np.exp(1j * ly.ql * za[0]))[:, None]  # rows: ex, ey, hx, hy, each of num_g
+            ehb = (ehl_bl @ np.exp(1j * ly.ql * (d - za[0])))[:, None]
+        else:
+            exp_f = np.exp(1j * qla * za)
+            # exp(i q (d - z)) = exp(i q d) / exp(i q z) needs one exponential per mode instead of one per mode and z point.
+            # Strongly evanescent modes in thick layers could under/overflow the two factors, those use the direct form.
+            if np.abs(ly.ql.imag).max() * (abs(d) + np.abs(za).max(initial=0.)) < 500.:
+                exp_b = np.exp(1j * qla * d) / exp_f
+            else:
+                exp_b = np.exp(1j * qla * (d - za))
+            ehf = ehl_al @ exp_f  # rows: ex, ey, hx, hy, each of num_g
+            ehb = ehl_bl @ exp_b
+        exf, eyf, hxf, hyf = np.split(ehf, 4)
+        exb, eyb, hxb, hyb = np.split(ehb, 4)
+        kx = self.pr.Kx[:, None]
+        ky = self.pr.Ky[:, None]
+        # 1j/omega * eizzcm and 1j/omega * mizzcm, kept on the layer until it is re-solved or omega changes
+        if ly.fs_zz is None or ly.fs_zz[0] is not ly.eizzcm or ly.fs_zz[1] is not ly.mizzcm or ly.fs_zz[2] != self.omega:
+            ly.fs_zz = (ly.eizzcm, ly.mizzcm, self.omega, (1j / self.omega * ly.eizzcm, 1j / self.omega * ly.mizzcm))
+        eizz, mizz = ly.fs_zz[3]
+        # forward and backward side by side, one product each for ez and hz
+        ezf, ezb = np.hsplit(eizz @ np.hstack([kx * hyf - ky * hxf, kx * hyb - ky * hxb]), 2)
+        hzf, hzb = np.hsplit(mizz @ np.hstack([kx * eyf - ky * exf, kx * eyb - ky * exb]), 2)
 
         return exf, exb, eyf, eyb, ezf, ezb, hxf, hxb, hyf, hyb, hzf, hzb
 
@@ -969,15 +1080,53 @@ class Inkstone:
             order = [order]
         elif type(order[0]) is int:
             order = [(o, 0) for o in order]
-        idx = np.array([self.pr.idx_g.index(o) for o in order])
+        idx = np.array(self.pr.idx_g_pos(order), dtype=np.intp)
 
         result = [f[idx] for f in [exf, exb, eyf, eyb, ezf, ezb, hxf, hxb, hyf, hyb, hzf, hzb]]
 
         return tuple(result)
 
+    def _calc_layer_fourier(self,
+                            layer: str,
+                            z: Union[float, List[float], np.ndarray, Tuple[float]] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Fourier components of the total (forward plus backward) fields in a layer at the given z points.
+
+        The structure must have been solved.
+
+        Returns
+        -------
+        ex, ey, ez, hx, hy, hz  :   np.ndarray
+            shape (num_g, len(z))
+        """
+        self._calc_al_bl_layer(self._layer_idx[layer])
+        exf, exb, eyf, eyb, ezf, ezb, hxf, hxb, hyf, hyb, hzf, hzb = self._calc_field_fs_layer_fb(layer, z)  # each has shape (num_g, len(z))
+        return exf + exb, eyf + eyb, ezf + ezb, hxf + hxb, hyf + hyb, hzf + hzb
+
+    def _calc_phasor(self, xy: Union[Tuple[float, float], List[Tuple[float, float]], np.ndarray]) -> np.ndarray:
+        """
+        exp(i (kx x + ky y)) of all the g points at the (x, y) points, shape (len(xy), num_g).
+
+        It doesn't depend on the layer, so field queries spanning several layers compute it once.
+        """
+        xya = np.asarray(xy, dtype=float).reshape(-1, 2)
+        # kx x + ky y for all pairs is the product of the (len(xy), 2) points and the (2, num_g) k points
+        return np.exp(1j * (xya @ np.asarray(self.pr.ks).T))
+
+    @staticmethod
+    def _apply_phasor(phasor: np.ndarray,
+                      fields: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Sum the Fourier components `fields` (ex, ey, ez, hx, hy, hz) with `phasor` into the physical fields, shape (len(xy), len(z)).
+        """
+        # all six components side by side, so one product with 6 len(z) columns
+        Ex, Ey, Ez, hx, hy, hz = np.hsplit(phasor @ np.hstack(fields), 6)
+        Hx, Hy, Hz = [-1j * h for h in [hx, hy, hz]]
+        return Ex, Ey, Ez, Hx, Hy, Hz
+
     def GetLayerFieldsListPoints(self,
                                  layer: str,
-                                 xy: Union[Tuple[float, float], List[Tuple[float, float]]],
+                                 xy: Union[Tuple[float, float], List[Tuple[float, float]], np.ndarray],
                                  z: Union[float, List[float], np.ndarray, Tuple[float]] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
         """
         Calculate fields at the list of (x, y) points defined in `xy` in each z plane in the `z` list.
@@ -988,7 +1137,7 @@ class Inkstone:
         ----------
         layer :
             name of the layer
-        xy :  a single tuple or a list of tuples.
+        xy :  a single tuple, a list of tuples, or an array of shape (n, 2).
             This is a list of random (x, y) points. These points don't need to any particular ordering, neither do they need to be on a regular grid.
         z : array_like.
             A list of random z points. These points don't need to any particular ordering, neither do they need to be on a regular grid.
@@ -1006,21 +1155,7 @@ class Inkstone:
         if not self.pr.q0_contain_0:
             # solve structure first
             self.solve()
-            i = list(self.layers.keys()).index(layer)
-            self._calc_al_bl_layer(i)
-
-            exf, exb, eyf, eyb, ezf, ezb, hxf, hxb, hyf, hyb, hzf, hzb = self._calc_field_fs_layer_fb(layer, z)  # each has shape (num_g, len(z))
-            ex, ey, ez, hx, hy, hz = [a + b for a, b in [(exf, exb), (eyf, eyb), (ezf, ezb), (hxf, hxb), (hyf, hyb), (hzf, hzb)]]
-
-            xa, ya = np.hsplit(np.array(xy), 2)  # 2d array with one column
-
-            kxa, kya = np.hsplit(np.array(self.pr.ks), 2)  # 2d array with one column
-
-            phase = xa * kxa.T + ya * kya.T  # shape (len(xy), numg)
-
-            Ex, Ey, Ez = [(np.exp(1j * phase) @ e) for e in [ex, ey, ez]]  # shape (len(xy), len(z))
-
-            Hx, Hy, Hz = [(-1j * np.exp(1j * phase) @ h) for h in [hx, hy, hz]]  # shape (len(xy), len(z))
+            Ex, Ey, Ez, Hx, Hy, Hz = self._apply_phasor(self._calc_phasor(xy), self._calc_layer_fourier(layer, z))
 
         else:
             Ex, Ey, Ez, Hx, Hy, Hz = [np.nan*np.zeros((len(xy), len(z))) for i in range(6)]
@@ -1084,7 +1219,7 @@ class Inkstone:
         x, y, z = uu
 
         xx, yy = np.meshgrid(x, y)
-        xy = list(zip(xx.ravel(), yy.ravel()))
+        xy = np.column_stack([xx.ravel(), yy.ravel()])
 
         fields = self.GetLayerFieldsListPoints(layer, xy, z)
 
@@ -1093,7 +1228,7 @@ class Inkstone:
         return Ex, Ey, Ez, Hx, Hy, Hz
 
     def GetFieldsListPoints(self,
-                            xy: Union[Tuple[float, float], List[Tuple[float, float]]],
+                            xy: Union[Tuple[float, float], List[Tuple[float, float]], np.ndarray],
                             z: Union[float, List[float], np.ndarray, Tuple[float]] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
         """
         Calculate fields at the list of (x, y) points defiend by `xy` in each z plane in the `z` list.
@@ -1102,10 +1237,13 @@ class Inkstone:
 
         Parameters
         ----------
-        xy :  a single tuple or a list of tuples.
+        xy :  a single tuple, a list of tuples, or an array of shape (n, 2).
             This is a list of random (x, y) points. These points don't need to any particular ordering, neither do they need to be on a regular grid.
         z : array_like.
             A list of random z points. These points don't need to any particular ordering, neither do they need to be on a regular grid.
+            z = 0 is the interface between the incident layer and the next. Each layer covers the half-open interval
+            [z_start, z_end) between its two interfaces, so a point exactly on an interface belongs to the layer after it,
+            and a point on the last interface (or at z = 0 if there are no middle layers) belongs to the output layer.
 
         Returns
         -------
@@ -1113,31 +1251,33 @@ class Inkstone:
             The returned field. Each is a 2d `numpy.ndarray`. The 1st index corresponds to the points in the `xy` list and the 2nd index corresponds to the `z` list.
 
         """
+        if type(xy) is tuple:
+            xy = [xy]
+
         self.solve()
 
-        ll = list(self.layers.keys())
+        ll = self._layer_names
 
-        if hasattr(z, "__len__"):
-            za = np.array(z)
-        else:
-            za = np.array([z])
+        za = np.atleast_1d(z)
+
+        if self.pr.q0_contain_0:
+            return tuple(np.nan * np.zeros((len(xy), len(za))) for i in range(6))
 
         Fields = [np.zeros((len(xy), len(za)), dtype=complex) for i in range(6)]
+        phasor = self._calc_phasor(xy)  # the same for all layers
 
-        z_interfaces = self.thicknesses_c[:-1]  # -1 is output with thickness 0
+        z_interfaces = self._thicknesses_c_arr[:-1]  # -1 is output with thickness 0
 
-        i_in_l = [za < z_interfaces[0]]
-        for idx, zi in enumerate(z_interfaces[:-1]):
-            i_in_l.append((za >= zi) * (za < z_interfaces[idx + 1]))
-        i_in_l.append(za > z_interfaces[-1])
+        # layer of each z point: layer k covers [z_interfaces[k-1], z_interfaces[k]), the output layer everything after
+        bins = np.searchsorted(z_interfaces, za, side='right')
+        layer_z0 = np.concatenate([[0.], z_interfaces])  # z of the left interface of each layer
 
-        for idx, iin in enumerate(i_in_l):
-            za_l = za[iin] - ([0] + z_interfaces)[idx]  # z coordinate of this layer w.r.t. the left interface of this layer
-            z_l = za_l.tolist()
-            if z_l:
-                fields = self.GetLayerFieldsListPoints(ll[idx], xy, z_l)
-                for F, f in zip(Fields, fields):
-                    F[:, iin] = f
+        for idx in np.unique(bins):
+            iin = bins == idx
+            z_l = za[iin] - layer_z0[idx]  # z coordinate of this layer w.r.t. the left interface of this layer
+            fields = self._apply_phasor(phasor, self._calc_layer_fourier(ll[idx], z_l))
+            for F, f in zip(Fields, fields):
+                F[:, iin] = f
 
         Ex, Ey, Ez, Hx, Hy, Hz = Fields
 
@@ -1166,6 +1306,7 @@ class Inkstone:
             the limits (included) and the number of points in each direction. Field values on the 3d grid points spanned will be returned.
         x, y, z : array_like
             `x` overrides `xmin`, `xmax`, and `nx`. `y` overrides `ymin`, `ymax`, and `ny`. `z` overrides `zmin`, `zmax`, and `nz`.
+            A z point exactly on an interface is evaluated in the layer after it, see `GetFieldsListPoints`.
 
         Returns
         -------
@@ -1194,7 +1335,7 @@ class Inkstone:
 
         x, y, z = uu
         xx, yy = np.meshgrid(x, y)
-        xy = list(zip(xx.ravel(), yy.ravel()))
+        xy = np.column_stack([xx.ravel(), yy.ravel()])
 
         fields = self.GetFieldsListPoints(xy, z)
 
@@ -1226,17 +1367,19 @@ class Inkstone:
         if not self.pr.q0_contain_0:
 
             self.solve()
-            i = list(self.layers.keys()).index(layer)
+            i = self._layer_idx[layer]
             self._calc_al_bl_layer(i)
 
-            t1 = time.process_time()
+            t1 = self.pr.tic()
             exf, exb, eyf, eyb, ezf, ezb, hxf, hxb, hyf, hyb, hzf, hzb = self._calc_field_fs_layer_fb(layer, z)
-            ex, ey, ez, hx, hy, hz = [a + b for a, b in [(exf, exb), (eyf, eyb), (ezf, ezb), (hxf, hxb), (hyf, hyb), (hzf, hzb)]]
-
-            sf = -1.j / 4. * ((np.einsum('i...,i...', ex.conj(), hyf) - np.einsum('i...,i...', ey.conj(), hxf))
-                              - (np.einsum('i...,i...', hy.conj(), exf) - np.einsum('i...,i...', hx.conj(), eyf)))  # 1d array of length len(z)
-            sb = -1.j / 4. * ((np.einsum('i...,i...', ex.conj(), hyb) - np.einsum('i...,i...', ey.conj(), hxb))
-                              - (np.einsum('i...,i...', hy.conj(), exb) - np.einsum('i...,i...', hx.conj(), eyb)))
+            # S_z = E* x H, summed over orders: conj(ex) hy - conj(ey) hx - conj(hy) ex + conj(hx) ey.
+            # The conjugated total fields, with the signs folded in, are stacked once and shared by both directions.
+            n = exf.shape[0]
+            c = np.concatenate([exf + exb, eyf + eyb, hyf + hyb, hxf + hxb])
+            np.conjugate(c, out=c)
+            c[n:3*n] *= -1.
+            sf = -1.j / 4. * np.einsum('ij,ij->j', c, np.concatenate([hyf, hxf, exf, eyf]))  # 1d array of length len(z)
+            sb = -1.j / 4. * np.einsum('ij,ij->j', c, np.concatenate([hyb, hxb, exb, eyb]))
 
             if sf.size == 1:
                 sf = sf[0].real
@@ -1284,10 +1427,10 @@ class Inkstone:
         if not self.pr.q0_contain_0:
 
             self.solve()
-            i = list(self.layers.keys()).index(layer)
+            i = self._layer_idx[layer]
             self._calc_al_bl_layer(i)
 
-            t1 = time.process_time()
+            t1 = self.pr.tic()
             if order is None:
                 order = [(0, 0)]
             elif type(order) is int:
@@ -1296,16 +1439,17 @@ class Inkstone:
                 order = [order]
             elif type(order[0]) is int:
                 order = [(o, 0) for o in order]
-            idx = np.array([self.pr.idx_g.index(o) for o in order])
+            idx = np.array(self.pr.idx_g_pos(order), dtype=np.intp)
 
             exf, exb, eyf, eyb, ezf, ezb, hxf, hxb, hyf, hyb, hzf, hzb = self._calc_field_fs_layer_fb(layer, z)
 
-            ex, ey, hx, hy = [a + b for a, b in [(exf, exb), (eyf, eyb), (hxf, hxb), (hyf, hyb)]]
-
-            sf = -1.j / 4. * ((ex.conj()[idx, :] * hyf[idx, :] - ey.conj()[idx, :] * hxf[idx, :])
-                              - (hy.conj()[idx, :] * exf[idx, :] - hx.conj()[idx, :] * eyf[idx, :]))  # 1d array of length len(z)
-            sb = -1.j / 4. * ((ex.conj()[idx, :] * hyb[idx, :] - ey.conj()[idx, :] * hxb[idx, :])
-                              - (hy.conj()[idx, :] * exb[idx, :] - hx.conj()[idx, :] * eyb[idx, :]))
+            # only the selected orders are needed, so gather them before combining
+            exf, exb, eyf, eyb, hxf, hxb, hyf, hyb = [f[idx] for f in [exf, exb, eyf, eyb, hxf, hxb, hyf, hyb]]
+            # same sign folding as in `GetPowerFlux`, but not summed over the orders
+            c = np.conjugate(np.stack([exf + exb, eyf + eyb, hyf + hyb, hxf + hxb]))
+            c[1:3] *= -1.
+            sf = -1.j / 4. * np.einsum('kij,kij->ij', c, np.stack([hyf, hxf, exf, eyf]))  # shape (len(order), len(z))
+            sb = -1.j / 4. * np.einsum('kij,kij->ij', c, np.stack([hyb, hxb, exb, eyb]))
 
             if sf.size == 1:
                 sf = sf.ravel()[0].real
@@ -1361,42 +1505,39 @@ class Inkstone:
         if not self.pr.q0_contain_0:
 
             self.solve()
-            sm_b = self.sm
-
-            sm = np.block([[sm_b[0], sm_b[1]],
-                           [sm_b[2], sm_b[3]]])
+            ng = self.pr.num_g
 
             rci = []
             rco = []
 
             if channels_exclude is not None:
-                rci = list(range(self.pr.num_g))
-                for a in channels_exclude:
-                    i = self.pr.idx_g.index(a)
-                    rci.pop(i)
-                rci += [a + self.pr.num_g for a in rci]
-                rco = [a + 2 * self.pr.num_g for a in rci]
+                ex = set(self.pr.idx_g_pos(channels_exclude))
+                rci = [i for i in range(ng) if i not in ex]
+                rci += [a + ng for a in rci]
+                rco = [a + 2 * ng for a in rci]
             elif channels_in is not None:
-                rci = [self.pr.idx_g.index(a) for a in channels_in]
-                rci += [a+self.pr.num_g for a in rci]
+                rci = self.pr.idx_g_pos(channels_in)
+                rci += [a + ng for a in rci]
                 if channels_out is not None:
-                    rco = [self.pr.idx_g.index(a) + 2 * self.pr.num_g for a in channels_out]
-                    rco += [a + self.pr.num_g for a in rco]
+                    rco = [a + 2 * ng for a in self.pr.idx_g_pos(channels_out)]
+                    rco += [a + ng for a in rco]
             elif channels_out is not None:
-                rco = [self.pr.idx_g.index(a) + 2 * self.pr.num_g for a in channels_out]
-                rco += [a + self.pr.num_g for a in rco]
+                rco = [a + 2 * ng for a in self.pr.idx_g_pos(channels_out)]
+                rco += [a + ng for a in rco]
             elif channels is not None:
-                rci = [self.pr.idx_g.index(a) for a in channels]
-                rci += [a+self.pr.num_g for a in rci]
-                rco = [a + 2 * self.pr.num_g for a in rci]
+                rci = self.pr.idx_g_pos(channels)
+                rci += [a + ng for a in rci]
+                rco = [a + 2 * ng for a in rci]
             elif radiation_channels_only:
-                layersl = list(self.layers.values())
+                layersl = self._layers_list
                 rci = layersl[0].rad_cha
-                rco = [a + 2*self.pr.num_g for a in layersl[-1].rad_cha]
+                rco = [a + 2 * ng for a in layersl[-1].rad_cha]
 
+            # the blocked s-matrix is kept from `_calc_sm`; a selection is gathered from it in one pass
+            sm = self._sm_full
             if rci or rco:
                 rc = rci + rco
-                sm = sm[rc, :][:, rc]
+                sm = sm[np.ix_(rc, rc)]
 
             dets = la.slogdet(sm)
 
@@ -5,6 +5,18 @@ import numpy as np
 import scipy.linalg as sla
 # import scipy.sparse as sps
 # import warnings
+from typing import NamedTuple, Tuple, Union
+
+
+class SM(NamedTuple):
+    """
+    Scattering matrix, (bi, ao) = S (ai, bo), held as its four blocks.
+    For the incident (output) region s21 (s12) is an LU factorization tuple instead of an ndarray.
+    """
+    s11: np.ndarray
+    s12: Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]
+    s21: Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]
+    s22: np.ndarray
 
 
 def s_1l(thickness, ql, al0, bl0):
@@ -23,8 +35,8 @@ def s_1l(thickness, ql, al0, bl0):
 
     Returns
     -------
-    s11, s12, s21, s22  :   ndarray
-                            four elements of the scattering matrix
+    SM
+        four elements of the scattering matrix
 
     """
 
@@ -43,7 +55,7 @@ def s_1l(thickness, ql, al0, bl0):
     s11 = s22
     s12 = s21
 
-    return s11, s12, s21, s22
+    return SM(s11, s12, s21, s22)
 
 
 def s_1l_in(al0, bl0):
@@ -58,7 +70,8 @@ def s_1l_in(al0, bl0):
 
     Returns
     -------
-    s11, s12, s21, s22  :   ndarray
+    SM
+        s21 is the LU factorization tuple used by `rsp_in`.
     """
 
     a = al0
@@ -76,7 +89,7 @@ def s_1l_in(al0, bl0):
     s21 = aTlu2
     s22 = - ab
 
-    return s11, s12, s21, s22
+    return SM(s11, s12, s21, s22)
 
 
 def s_1l_out(al0, bl0):
@@ -91,7 +104,8 @@ def s_1l_out(al0, bl0):
 
     Returns
     -------
-    s11, s12, s21, s22  :   ndarray
+    SM
+        s12 is the LU factorization tuple used by `rsp_out`.
     """
 
     a = al0
@@ -109,6 +123,6 @@ def s_1l_out(al0, bl0):
     s21 = 1./2. * (a - b @ ab)
     s22 = sla.lu_solve(aTlu, b.T).T
 
-    return s11, s12, s21, s22
+    return SM(s11, s12, s21, s22)
 
 
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from inkstone import Inkstone
+
+
+def build_sim(layers=(), in_material='vacuum', out_material='di', out_copy_of=None, num_g=5):
+    """
+    A 1D-periodic (lattice 1) test structure, excited by an s-polarized wave at 10 degrees and frequency 0.4.
+
+    Parameters
+    ----------
+    layers          :   the middle layers in order, each (name, thickness, material, box_width).
+                        A box_width other than None adds a vacuum box of that width centered at 0.5.
+    in_material     :   background material of the incident layer 'in'
+    out_material    :   background material of the output layer 'out'
+    out_copy_of     :   if given, the output layer 'out' is a layer copy of this middle layer instead
+    num_g           :   number of g points
+
+    Materials 'di' (epsilon 12) and 'lossy' (epsilon 4+0.5j) are available besides vacuum.
+    """
+    s = Inkstone()
+    s.lattice = 1
+    s.num_g = num_g
+    s.AddMaterial(name='di', epsilon=12)
+    s.AddMaterial(name='lossy', epsilon=4 + 0.5j)
+    s.AddLayer(name='in', thickness=0, material_background=in_material)
+    for name, thickness, material, width in layers:
+        s.AddLayer(name=name, thickness=thickness, material_background=material)
+        if width is not None:
+            s.AddPattern1D(layer=name, pattern_name='box', material='vacuum', width=width, center=0.5)
+    if out_copy_of is None:
+        s.AddLayer(name='out', thickness=0, material_background=out_material)
+    else:
+        s.AddLayerCopy(name='out', original_layer=out_copy_of, thickness=0)
+    s.frequency = 0.4
+    s.SetExcitation(theta=10, phi=0, s_amplitude=1, p_amplitude=0)
+    return s
+
+
+@pytest.fixture
+def make_sim():
+    """Factory fixture for `build_sim`."""
+    return build_sim
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+
+def _stack(make_sim, middle=True):
+    if middle:
+        return make_sim([('slab', 0.5, 'di', 0.45), ('film', 0.2, 'di', None)])
+    # a lone interface: incident from the dielectric into vacuum
+    return make_sim(in_material='di', out_material='vacuum')
+
+
+def _assert_fields_equal(fa, fb):
+    for a, b in zip(fa, fb):
+        np.testing.assert_allclose(a, b, rtol=1e-12, atol=1e-14)
+
+
+@pytest.mark.parametrize('middle', [True, False])
+def test_point_on_last_interface_is_in_output_layer(make_sim, middle):
+    s = _stack(make_sim, middle)
+    xy = [(0.1, 0.), (0.6, 0.)]
+    z_last = 0.7 if middle else 0.
+    fields = s.GetFieldsListPoints(xy, [z_last])
+    _assert_fields_equal(fields, s.GetLayerFieldsListPoints('out', xy, 0.))
+    assert np.abs(fields[1]).max() > 0.
+
+
+def test_point_on_middle_interface_is_in_next_layer(make_sim):
+    s = _stack(make_sim)
+    xy = [(0.1, 0.), (0.6, 0.)]
+    _assert_fields_equal(s.GetFieldsListPoints(xy, [0.]), s.GetLayerFieldsListPoints('slab', xy, 0.))
+    _assert_fields_equal(s.GetFieldsListPoints(xy, [0.5]), s.GetLayerFieldsListPoints('film', xy, 0.))
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+# incident and output regions: vacuum, non-vacuum, and a layer copy of a middle layer as the output
+REGIONS = {
+    'vacuum': dict(in_material='vacuum', out_material='vacuum'),
+    'substrate': dict(in_material='di', out_material='lossy'),
+    'copy': dict(in_material='vacuum', out_copy_of='c'),
+}
+
+# (name, thickness, material, box_width)
+LAYERS = [
+    ('a', 0.2, 'di', 0.4),
+    ('b', 0., 'vacuum', None),
+    ('c', 0.15, 'di', None),
+    ('d', 0.3, 'lossy', 0.3),
+    ('e', 0.1, 'vacuum', None),
+    ('f', 0.25, 'di', 0.5),
+    ('g', 0.2, 'lossy', None),
+    ('h', 0.12, 'di', None),
+]
+
+
+def _edit(layers, name, **kw):
+    """`layers` with the given fields of layer `name` replaced"""
+    fields = ['name', 'thickness', 'material', 'width']
+    return [tuple(kw.get(f, v) for f, v in zip(fields, ly)) if ly[0] == name else ly for ly in layers]
+
+
+# each step is applied to the incrementally re-solved simulator, and to the spec of the fresh one
+STEPS = [
+    ('thickness', lambda s: s.SetLayer('d', thickness=0.35), lambda ls: _edit(ls, 'd', thickness=0.35)),
+    ('pattern', lambda s: s.SetPattern('f', 'box', width=0.6), lambda ls: _edit(ls, 'f', width=0.6)),
+    ('material', lambda s: s.SetLayer('c', material_bg='lossy'), lambda ls: _edit(ls, 'c', material='lossy')),
+    ('last thickness', lambda s: s.SetLayer('h', thickness=0.2), lambda ls: _edit(ls, 'h', thickness=0.2)),
+    ('first thickness', lambda s: s.SetLayer('a', thickness=0.1), lambda ls: _edit(ls, 'a', thickness=0.1)),
+]
+
+
+def _results(s):
+    s.solve()
+    names = list(s.layers.keys())
+    z = np.linspace(-0.1, s.total_thickness + 0.1, 17)
+    xy = [(0.1, 0.), (0.55, 0.)]
+    return {
+        'sm': list(s.sm),
+        'flux': [np.array(s.GetPowerFlux(n)) for n in [names[0], 'c', 'f', names[-1]]],
+        'fields': list(s.GetFieldsListPoints(xy, z)),
+    }
+
+
+def _assert_results_equal(inc, fresh, where):
+    for key in fresh:
+        for a, b in zip(inc[key], fresh[key]):
+            np.testing.assert_allclose(a, b, rtol=1e-9, atol=1e-11 * max(np.abs(b).max(), 1.), err_msg='{}: {}'.format(where, key))
+
+
+@pytest.mark.parametrize('region', list(REGIONS))
+def test_incremental_resolve_matches_fresh(make_sim, region):
+    layers = LAYERS
+    s = make_sim(layers, **REGIONS[region])
+    _results(s)
+
+    for step, edit, edit_spec in STEPS:
+        edit(s)
+        layers = edit_spec(layers)
+        _assert_results_equal(_results(s), _results(make_sim(layers, **REGIONS[region])), step)
+
+    s.frequency = 0.45
+    fresh = make_sim(layers, **REGIONS[region])
+    fresh.frequency = 0.45
+    _assert_results_equal(_results(s), _results(fresh), 'frequency')
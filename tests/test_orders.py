@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def sim(make_sim):
+    s = make_sim([('slab', 0.5, 'di', None)], out_material='vacuum')
+    s.GetPowerFlux('slab')  # solves, and GetAmplitudesByOrder relies on that
+    return s
+
+
+def test_known_orders(sim):
+    assert sim.pr.idx_g_pos([(0, 0), (1, 0)]) == [sim.pr.idx_g.index((0, 0)), sim.pr.idx_g.index((1, 0))]
+
+
+@pytest.mark.parametrize('call', [
+    lambda s: s.GetAmplitudesByOrder('slab', order=[(0, 0), (50, 0)]),
+    lambda s: s.GetPowerFluxByOrder('slab', order=(50, 0)),
+    lambda s: s.GetSMatrixDet(channels=[(50, 0)]),
+    lambda s: s.GetSMatrixDet(channels_exclude=[(50, 0)]),
+])
+def test_unknown_order_raises_value_error(sim, call):
+    with pytest.raises(ValueError, match=r'order \(50, 0\) not in idx_g'):
+        call(sim)
+
+
+def test_exclude_orders_det(sim):
+    excluded = [(1, 0), (-1, 0)]
+    ng = sim.pr.num_g
+    kept = [i for i, o in enumerate(sim.pr.idx_g) if o not in excluded]
+    assert len(kept) == ng - len(excluded)
+    # both polarizations of the kept orders, in the incident then the output region
+    rc = [i + p * ng + r * 2 * ng for r in range(2) for p in range(2) for i in kept]
+    sign, logdet = np.linalg.slogdet(sim._sm_full[np.ix_(rc, rc)])
+    sign_ex, logdet_ex = sim.GetSMatrixDet(channels_exclude=excluded)
+    np.testing.assert_allclose(sign_ex, sign, rtol=1e-12)
+    np.testing.assert_allclose(logdet_ex, logdet, rtol=1e-12)
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+import inkstone.simulator as simulator
+from inkstone.rsp import rsp, rsp_scan
+
+
+def _random_sms(m, n, seed=0):
+    r = np.random.default_rng(seed)
+    # small blocks keep (I - S S) well conditioned
+    return [[0.3 * (r.standard_normal((n, n)) + 1j * r.standard_normal((n, n))) for _ in range(4)] for _ in range(m)]
+
+
+@pytest.mark.parametrize('m', [1, 2, 3, 5, 8, 21])
+def test_rsp_scan_matches_serial_chain(m):
+    sms = _random_sms(m, 6)
+    pf = rsp_scan(*(np.stack([s[c] for s in sms]) for c in range(4)))
+    p = sms[0]
+    for k in range(m):
+        if k:
+            p = rsp(*p, *sms[k])
+        for c in range(4):
+            np.testing.assert_allclose(pf[c][k], p[c], rtol=1e-12, atol=1e-12)
+
+
+def _multilayer(make_sim, n_layers):
+    layers = [('l{}'.format(i), 0.1 + 0.01 * i, 'di' if i % 2 else 'lossy', 0.3 + 0.01 * i if i % 3 == 0 else None)
+              for i in range(n_layers)]
+    return make_sim(layers, num_g=3)
+
+
+def test_calc_sm_scan_matches_serial(make_sim, monkeypatch):
+    calls = []
+
+    def rsp_scan_counted(*args):
+        calls.append(1)
+        return rsp_scan(*args)
+
+    monkeypatch.setattr(simulator, 'rsp_scan', rsp_scan_counted)
+
+    n_layers = 2 * simulator.SCAN_MIN_BLOCKS
+    s_scan = _multilayer(make_sim, n_layers)
+    assert 2 * s_scan.pr.num_g <= simulator.SCAN_MAX_SIZE
+    s_scan.solve()
+    assert calls
+
+    monkeypatch.setattr(simulator, 'SCAN_MIN_BLOCKS', n_layers + 10)
+    s_serial = _multilayer(make_sim, n_layers)
+    n_calls = len(calls)
+    s_serial.solve()
+    assert len(calls) == n_calls
+
+    for a, b in zip(s_scan.sm, s_serial.sm):
+        np.testing.assert_allclose(a, b, rtol=1e-10, atol=1e-12)
+    for name in ['in', 'l5', 'out']:
+        np.testing.assert_allclose(s_scan.GetPowerFlux(name), s_serial.GetPowerFlux(name), rtol=1e-10, atol=1e-12)